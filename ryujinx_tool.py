@@ -4,6 +4,7 @@
 
 import argparse
 from argparse import ArgumentError, _get_action_name
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import cmp_to_key
 import glob
@@ -12,6 +13,7 @@ import json
 import os
 import re
 import shutil
+import sqlite3
 import subprocess
 from subprocess import CalledProcessError
 import sys
@@ -58,6 +60,21 @@ syncsaves_arg = actions_arg_group.add_argument(
     choices=full_priority_choices,
     help="""Export csv file with update available status for update files.\nPriority includes yuzu, ryujinx or newer. Add '~' before priority (e.g. ~yuzu) to use simulation mode.\nRequires --ryujinxdir, --yuzudir""",
 )
+reconcile_arg = actions_arg_group.add_argument(
+    "--reconcile",
+    action="store_true",
+    help="""Drop or re-point entries of missing NSP files in Ryujinx updates.json & dlc.json.\nMoved files are matched by title id when --nspdir is provided. Requires --ryujinxdir""",
+)
+apply_arg = actions_arg_group.add_argument(
+    "--apply",
+    metavar="<file>",
+    help="Apply operations recorded by --plan. Completed operations are skipped when applying again.",
+)
+buildcatalog_arg = actions_arg_group.add_argument(
+    "--build-catalog",
+    action="store_true",
+    help="""Build local title catalog from titledb versions.json & titles json.\nUsed by --exportupdates & --syncsaves for names, latest versions & release dates.""",
+)
 parser.add_argument("-v", "--version", action="version", version=f"%(prog)s {VERSION}")
 ryujinxdir_arg = parser.add_argument(
     "-r",
@@ -83,6 +100,22 @@ versionspath_arg = parser.add_argument(
     metavar="<file>",
     help="File path of versions.json from titledb. If not provide will search in current folder or download from its source.",
 )
+plan_arg = parser.add_argument(
+    "--plan",
+    metavar="<file>",
+    help="Record operations of --autoadd, --syncsaves & --reconcile to a plan file instead of executing them.",
+)
+titlespath_arg = parser.add_argument(
+    "--titlespath",
+    metavar="<file>",
+    help="File path of titles json (e.g. US.en.json) from titledb. If not provide will search in current folder or download from its source.",
+)
+catalogpath_arg = parser.add_argument(
+    "--catalogpath",
+    metavar="<file>",
+    help="File path of title catalog database. Default to current folder.",
+    default=os.path.join(dir_path, "titledb.sqlite"),
+)
 hactoolnet_arg = parser.add_argument(
     "--hactoolnet",
     metavar="<file>",
@@ -105,6 +138,12 @@ nsp_dir = arguments.nspdir
 hactoolnet_path = arguments.hactoolnet
 title_keys_path = arguments.titlekeys
 versions_path = arguments.versionspath
+titles_path = arguments.titlespath
+catalog_path = arguments.catalogpath
+should_build_catalog = arguments.build_catalog
+should_reconcile = arguments.reconcile
+plan_path = arguments.plan
+apply_path = arguments.apply
 should_auto_add = arguments.autoadd
 should_export_csv = arguments.exportupdates
 should_sync_saves = arguments.syncsaves is not None
@@ -112,6 +151,26 @@ sync_priority = arguments.syncsaves
 should_simulate_sync = should_sync_saves and arguments.syncsaves[0] == "~"
 
 local_versions_path = os.path.join(dir_path, "versions.json")
+local_titles_path = os.path.join(dir_path, "US.en.json")
+
+TITLEDB_URL = "https://github.com/blawar/titledb/raw/master"
+
+WRITE_JSON_OPERATION = "write_json"
+ADD_IMKVDB_ENTRIES_OPERATION = "add_imkvdb_entries"
+COPY_SAVE_OPERATION = "copy_save"
+
+# imkvdb entries must exist before saves can be copied to their Ryujinx folders
+plan_operation_order = [
+    WRITE_JSON_OPERATION,
+    ADD_IMKVDB_ENTRIES_OPERATION,
+    COPY_SAVE_OPERATION,
+]
+PLAN_BATCH_SIZE = 50
+
+YUZU_TO_RYUJINX = "yuzu_to_ryujinx"
+RYUJINX_TO_YUZU = "ryujinx_to_yuzu"
+
+planned_operations = []
 
 
 def generate_ryujinx_json():
@@ -203,13 +262,7 @@ def generate_ryujinx_json():
             suffix=f"\nExporting {os.path.join(output_dir, 'updates.json')}",
         )
 
-        if not os.path.isdir(output_dir):
-            os.makedirs(output_dir)
-
-        with io.open(
-            os.path.join(output_dir, "updates.json"), "w", encoding="utf-8"
-        ) as f:
-            f.write(json.dumps(ryujinx_update_jsons, indent=2))
+        _write_json(os.path.join(output_dir, "updates.json"), ryujinx_update_jsons)
     print("\nFinished exporting updates.json")
 
     print("Exporting dlc.json")
@@ -225,37 +278,226 @@ def generate_ryujinx_json():
             suffix=f"\nExporting {os.path.join(output_dir, 'dlc.json')}",
         )
 
-        if not os.path.isdir(output_dir):
-            os.makedirs(output_dir)
-
-        with io.open(os.path.join(output_dir, "dlc.json"), "w", encoding="utf-8") as f:
-            f.write(json.dumps(ryujinx_dlc_jsons, indent=2))
+        _write_json(os.path.join(output_dir, "dlc.json"), ryujinx_dlc_jsons)
 
     print("\nFinished exporting dlc.json")
 
 
+def build_catalog():
+    versions_file = _get_titledb_file(versions_path, local_versions_path)
+    titles_file = _get_titledb_file(titles_path, local_titles_path)
+
+    print("Building catalog")
+
+    with open(versions_file, encoding="utf-8") as f:
+        versions_map = json.load(f)
+    with open(titles_file, encoding="utf-8") as f:
+        titles_map = json.load(f)
+
+    # Build into a temp file so a failed run never leaves a half-filled catalog
+    tmp_catalog_path = catalog_path + ".tmp"
+    if os.path.isfile(tmp_catalog_path):
+        os.remove(tmp_catalog_path)
+
+    conn = sqlite3.connect(tmp_catalog_path)
+    with conn:
+        conn.executescript(
+            """
+            CREATE TABLE titles (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                publisher TEXT,
+                release_date TEXT
+            ) WITHOUT ROWID;
+            CREATE TABLE versions (
+                id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                release_date TEXT,
+                PRIMARY KEY (id, version)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO versions VALUES (?, ?, ?)",
+            (
+                (application_id.lower(), int(version), date)
+                for application_id, versions in versions_map.items()
+                for version, date in versions.items()
+            ),
+        )
+        # Several nsuIds can point to the same title id, keep the first one
+        conn.executemany(
+            "INSERT OR IGNORE INTO titles VALUES (?, ?, ?, ?)",
+            (
+                (
+                    title["id"].lower(),
+                    title.get("name"),
+                    title.get("publisher"),
+                    _format_release_date(title.get("releaseDate")),
+                )
+                for title in titles_map.values()
+                if title.get("id") is not None
+            ),
+        )
+    total_titles = conn.execute("SELECT COUNT(*) FROM titles").fetchone()[0]
+    conn.close()
+
+    os.replace(tmp_catalog_path, catalog_path)
+    print(f"Built catalog with {total_titles} titles to {catalog_path}")
+
+
+def reconcile_ryujinx_json():
+    print("Reconciling games json")
+
+    json_paths = glob.glob(
+        os.path.join(ryujinx_dir, "games", "*", "updates.json")
+    ) + glob.glob(os.path.join(ryujinx_dir, "games", "*", "dlc.json"))
+    with ThreadPoolExecutor() as executor:
+        game_jsons = {
+            path: content
+            for path, content in zip(json_paths, executor.map(_load_json, json_paths))
+            if content is not None
+        }
+
+    queued_jsons = {}
+    if plan_path is not None:
+        # Json queued by --autoadd is not on disk yet, reconcile it instead of the old files
+        queued_jsons = {
+            _path_key(o["path"]): o
+            for o in planned_operations
+            if o["op"] == WRITE_JSON_OPERATION
+        }
+        game_jsons = {
+            path: queued_jsons[_path_key(path)]["content"]
+            if _path_key(path) in queued_jsons
+            else content
+            for path, content in game_jsons.items()
+        }
+        game_json_keys = {_path_key(path) for path in game_jsons}
+        for key, operation in queued_jsons.items():
+            if key not in game_json_keys:
+                game_jsons[operation["path"]] = operation["content"]
+
+    referenced_paths = set()
+    for json_path, content in game_jsons.items():
+        if os.path.basename(json_path) == "updates.json":
+            referenced_paths.update(content["paths"])
+        else:
+            referenced_paths.update(dlc["path"] for dlc in content)
+
+    # One scandir per directory instead of a stat per referenced path
+    referenced_dirs = {os.path.dirname(path) for path in referenced_paths}
+    with ThreadPoolExecutor() as executor:
+        dir_files = dict(zip(referenced_dirs, executor.map(_list_files, referenced_dirs)))
+    existing_keys = set().union(*(f for f in dir_files.values() if f is not None))
+    # Entries in unreadable directories can't be verified, keep them as they are
+    existing_keys.update(
+        _path_key(path)
+        for path in referenced_paths
+        if dir_files[os.path.dirname(path)] is None
+    )
+    referenced_keys = {_path_key(path) for path in referenced_paths}
+    missing_keys = referenced_keys - existing_keys
+
+    if len(missing_keys) == 0:
+        print("All entries are up to date")
+        return
+
+    moved_nsp_map = {}
+    if nsp_dir is not None:
+        moved_nsp_map = _scan_moved_nsp_files(referenced_keys)
+
+    total_dropped = 0
+    total_repointed = 0
+    for json_path, content in game_jsons.items():
+        changes = []
+
+        if os.path.basename(json_path) == "updates.json":
+            application_id = os.path.basename(os.path.dirname(json_path))
+            paths = []
+            for path in content["paths"]:
+                new_path = path
+                if _path_key(path) in missing_keys:
+                    new_nsp = _find_moved_nsp_file(
+                        path, moved_nsp_map.get(application_id, []), referenced_keys
+                    )
+                    new_path = None if new_nsp is None else new_nsp["path"]
+                    changes.append((path, new_path))
+                    if content["selected"] == path:
+                        content["selected"] = new_path
+                if new_path is not None:
+                    paths.append(new_path)
+            content["paths"] = paths
+            if content["selected"] is None or (
+                content["selected"] != "" and content["selected"] not in paths
+            ):
+                content["selected"] = paths[-1] if len(paths) > 0 else ""
+
+        else:
+            dlcs = []
+            for dlc in content:
+                if _path_key(dlc["path"]) in missing_keys:
+                    new_nsp = None
+                    # A bundle lists several dlc ncas, which can't be matched to a single scanned nca
+                    if len(dlc["dlc_nca_list"]) == 1:
+                        title_id = f"{dlc['dlc_nca_list'][0]['title_id']:016x}"
+                        new_nsp = _find_moved_nsp_file(
+                            dlc["path"],
+                            moved_nsp_map.get(title_id, []),
+                            referenced_keys,
+                        )
+                    if new_nsp is None:
+                        changes.append((dlc["path"], None))
+                        continue
+                    changes.append((dlc["path"], new_nsp["path"]))
+                    dlc["path"] = new_nsp["path"]
+                    # A different file of the same dlc may contain another nca
+                    dlc["dlc_nca_list"][0]["path"] = f"/{new_nsp['nca_id']}.nca"
+                dlcs.append(dlc)
+            content = dlcs
+
+        if len(changes) == 0:
+            continue
+
+        for old_path, new_path in changes:
+            if new_path is None:
+                total_dropped += 1
+                print("- Dropped", old_path, f"from\n\t{json_path}.")
+            else:
+                total_repointed += 1
+                print("- Re-pointed", old_path, f"to\n\t{new_path} in\n\t{json_path}.")
+
+        queued_json = queued_jsons.get(_path_key(json_path))
+        if queued_json is not None:
+            queued_json["content"] = content
+        else:
+            _write_json(json_path, content)
+
+    print(
+        f"Reconciled {len(missing_keys)} missing entries: {total_repointed} re-pointed, {total_dropped} dropped"
+    )
+
+
 def export_updates_csv():
     versions_map = {}
 
-    path = local_versions_path
-
-    if versions_path is not None:
-        path = versions_path
-    elif os.path.isfile(local_versions_path) is False:
-        print("Downloading versions.json")
-        target_path = os.path.join(dir_path, "versions.json")
-        versions_url = "https://github.com/blawar/titledb/raw/master/versions.json"
-        result = urllib.request.urlretrieve(versions_url, target_path)
-        path = result[0]
-        print(f"Downloaded to {path}")
+    catalog = _open_catalog()
+    # An explicit versions.json always takes precedence over the catalog
+    use_catalog_versions = catalog is not None and versions_path is None
+    if use_catalog_versions:
+        catalog_date = datetime.fromtimestamp(os.path.getmtime(catalog_path))
+        print(
+            f"Using catalog {catalog_path} built on {catalog_date:%Y-%m-%d %H:%M}. Provide --versionspath to override."
+        )
+    else:
+        path = _get_titledb_file(versions_path, local_versions_path)
+        with open(path, encoding="utf-8") as f:
+            versions_map = json.load(f)
+            f.close()
 
     print("Exporting updates.csv")
 
-    with open(path, encoding="utf-8") as f:
-        versions_map = json.load(f)
-        f.close()
-
-    output_csv = "Filename, Title ID, Version Code, Latest Version Code, Latest Updated Date, Update Available\n"
+    output_csv = "Filename, Title ID, Version Code, Latest Version Code, Latest Updated Date, Update Available, Name, Release Date, Publisher\n"
 
     nsp_files = glob.glob(os.path.join(nsp_dir, "**", "*.nsp"), recursive=True)
     total_files = len(nsp_files)
@@ -296,22 +538,96 @@ def export_updates_csv():
         application_id = title_id[:13] + "0" + title_id[14:]
 
         filename = os.path.basename(nsp_file)
+        name = ""
+        release_date = ""
+        publisher = ""
         latest_version_code = ""
         latest_version_date = ""
         is_update_available = None
         try:
-            latest_version = list(versions_map[application_id].items())[-1]
+            if catalog is not None:
+                title = _get_catalog_title(catalog, application_id)
+                if title is not None:
+                    name = title["name"] or ""
+                    release_date = title["release_date"] or ""
+                    publisher = title["publisher"] or ""
+            if use_catalog_versions:
+                latest_version = _get_catalog_latest_version(catalog, application_id)
+            else:
+                latest_version = list(versions_map[application_id].items())[-1]
             latest_version_code = latest_version[0]
             latest_version_date = latest_version[1]
             is_update_available = latest_version_code != version_code
         except KeyError:
             print(f"{filename} data not found")
-        output_csv += f'"{filename}", {title_id}, {version_code}, {latest_version_code}, {latest_version_date}, {is_update_available}\n'
+        name = name.replace('"', '""')
+        publisher = publisher.replace('"', '""')
+        output_csv += f'"{filename}", {title_id}, {version_code}, {latest_version_code}, {latest_version_date}, {is_update_available}, "{name}", {release_date}, "{publisher}"\n'
 
     with io.open(os.path.join(dir_path, "updates.csv"), "w", encoding="utf-8") as f:
         f.write(output_csv)
         print(f"Exported to {f.name}")
 
+    if catalog is not None:
+        catalog.close()
+
+
+def apply_plan():
+    with open(apply_path, encoding="utf-8") as f:
+        plan = json.load(f)
+
+    operations = plan["operations"]
+    pending_operations = [o for o in operations if o["done"] is False]
+    print(
+        f"Applying {len(pending_operations)} of {len(operations)} operations from {apply_path}"
+    )
+
+    save_maps = {}
+    for operation_type in plan_operation_order:
+        batch = [o for o in pending_operations if o["op"] == operation_type]
+        total_batch = len(batch)
+        for index, operation in enumerate(batch):
+            _progress_bar(index + 1, total_batch, suffix=f"\nApplying {operation_type}")
+
+            if operation_type == WRITE_JSON_OPERATION:
+                _write_json(operation["path"], operation["content"])
+
+            elif operation_type == ADD_IMKVDB_ENTRIES_OPERATION:
+                _add_imkvdb_entries(operation["ryujinx_dir"], operation["title_ids"])
+                _sort_imkvdb_entries(operation["ryujinx_dir"])
+                save_maps.pop(operation["ryujinx_dir"], None)
+
+            elif operation_type == COPY_SAVE_OPERATION:
+                _ryujinx_dir = operation["ryujinx_dir"]
+                if save_maps.get(_ryujinx_dir) is None:
+                    save_maps[_ryujinx_dir] = _get_save_map_from_imkvdb(_ryujinx_dir)[0]
+                ryujinx_save_dirname = save_maps[_ryujinx_dir].get(
+                    operation["title_id"]
+                )
+                if ryujinx_save_dirname is None:
+                    print(f"No imkvdb entry is found for {operation['title_id']}")
+                    continue
+                ryujinx_game_save_dir = os.path.join(
+                    _ryujinx_dir, "bis", "user", "save", ryujinx_save_dirname, "0"
+                )
+                if operation["direction"] == YUZU_TO_RYUJINX:
+                    _copy_save(operation["yuzu_dir"], ryujinx_game_save_dir)
+                else:
+                    _copy_save(ryujinx_game_save_dir, operation["yuzu_dir"])
+
+            operation["done"] = True
+            # Saves are backed up before copying, so copying again after a crash
+            # would override the backup. Only json writes are cheap to redo.
+            if (
+                operation_type != WRITE_JSON_OPERATION
+                or (index + 1) % PLAN_BATCH_SIZE == 0
+            ):
+                _save_plan(apply_path, operations)
+
+        _save_plan(apply_path, operations)
+
+    print("Plan applied")
+
 
 def sync_saves():
     print("Syncing saves")
@@ -323,13 +639,28 @@ def sync_saves():
     ryujinx_save_dir = os.path.join(ryujinx_dir, "bis", "user", "save")
 
     title_id_list = os.listdir(yuzu_save_dir)
-    if should_simulate_sync is False:
-        _add_imkvdb_entries(title_id_list)
-        _sort_imkvdb_entries()
+    if plan_path is not None:
+        _plan_operation(
+            ADD_IMKVDB_ENTRIES_OPERATION,
+            ryujinx_dir=os.path.abspath(ryujinx_dir),
+            title_ids=title_id_list,
+        )
+    elif should_simulate_sync is False:
+        _add_imkvdb_entries(ryujinx_dir, title_id_list)
+        _sort_imkvdb_entries(ryujinx_dir)
+
+    save_map, _, last_index = _get_save_map_from_imkvdb(ryujinx_dir)
 
-    save_map = _get_save_map_from_imkvdb()[0]
+    if plan_path is not None:
+        # New entries are only added on apply, predict the save dirs they will get
+        new_title_id_list = [
+            t.lower() for t in title_id_list if t.lower() not in save_map
+        ]
+        for i, title_id in enumerate(new_title_id_list, start=1):
+            save_map[title_id] = f"{last_index + i:016x}"
 
     total_saves = len(save_map.items())
+    catalog = _open_catalog()
 
     for index, (title_id, ryujinx_save_dirname) in enumerate(save_map.items()):
         yuzu_game_save_dir = os.path.join(yuzu_save_dir, title_id.upper())
@@ -337,18 +668,21 @@ def sync_saves():
             ryujinx_save_dir, ryujinx_save_dirname, "0"
         )
 
-        _sync_dir(yuzu_game_save_dir, ryujinx_game_save_dir, title_id)
+        _sync_dir(yuzu_game_save_dir, ryujinx_game_save_dir, title_id, catalog)
         _progress_bar(index + 1, total_saves)
 
+    if catalog is not None:
+        catalog.close()
+
     print("Saves synced")
 
 
-def _get_save_map_from_imkvdb():
+def _get_save_map_from_imkvdb(_ryujinx_dir):
     save_map = {}
     bcat_save_map = {}
     key_value_list = []
     imkvdb_path = os.path.join(
-        ryujinx_dir, "bis", "system", "save", "8000000000000000", "0", "imkvdb.arc"
+        _ryujinx_dir, "bis", "system", "save", "8000000000000000", "0", "imkvdb.arc"
     )
     last_index = 1
     with io.open(imkvdb_path, "rb") as f:
@@ -384,9 +718,8 @@ def _get_save_map_from_imkvdb():
     return save_map, key_value_list, last_index
 
 
-def _add_imkvdb_entries(title_id_list):
-
-    save_map, key_value_list, last_index = _get_save_map_from_imkvdb()
+def _add_imkvdb_entries(_ryujinx_dir, title_id_list):
+    save_map, key_value_list, last_index = _get_save_map_from_imkvdb(_ryujinx_dir)
     new_last_index = last_index
     existed_title_id_list = save_map.keys()
     new_title_id_list = list(
@@ -395,7 +728,7 @@ def _add_imkvdb_entries(title_id_list):
     new_total_entries = len(key_value_list) + len(new_title_id_list)
 
     imkvdb_root = os.path.join(
-        ryujinx_dir, "bis", "system", "save", "8000000000000000", "0"
+        _ryujinx_dir, "bis", "system", "save", "8000000000000000", "0"
     )
     imkvdb_path = os.path.join(imkvdb_root, "imkvdb.arc")
 
@@ -443,11 +776,11 @@ def _add_imkvdb_entries(title_id_list):
         f.write(bytes.fromhex(last_index_b))
 
 
-def _sort_imkvdb_entries():
-    _, key_value_list, _ = _get_save_map_from_imkvdb()
+def _sort_imkvdb_entries(_ryujinx_dir):
+    _, key_value_list, _ = _get_save_map_from_imkvdb(_ryujinx_dir)
 
     imkvdb_path = os.path.join(
-        ryujinx_dir, "bis", "system", "save", "8000000000000000", "0", "imkvdb.arc"
+        _ryujinx_dir, "bis", "system", "save", "8000000000000000", "0", "imkvdb.arc"
     )
 
     if os.path.isfile(imkvdb_path) is False:
@@ -502,14 +835,210 @@ def _reverse_hex_str(hex_str: str):
     return output
 
 
-def _sync_dir(_yuzu_dir, _ryujinx_dir, title_id):
-    log_suffix = "- [Simulate]" if should_simulate_sync else "-"
+def _load_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print("- Skipped", path, "as it cannot be read.")
+        return None
+
+
+def _path_key(path):
+    # Paths from json may differ from the filesystem in separators & case on Windows
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _list_files(root_dir):
+    try:
+        with os.scandir(root_dir) as entries:
+            return {
+                _path_key(os.path.join(root_dir, e.name))
+                for e in entries
+                if e.is_file()
+            }
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
+    except PermissionError:
+        print("- Skipped", root_dir, "as it cannot be read.")
+        return None
+
+
+def _scan_moved_nsp_files(referenced_keys):
+    # Only unreferenced NSPs can be the new location of a missing entry
+    moved_nsp_map = {}
+
+    # Ryujinx needs absolute paths, so re-point with them
+    nsp_files = [
+        nsp_file
+        for nsp_file in map(
+            os.path.abspath,
+            glob.glob(os.path.join(nsp_dir, "**", "*.nsp"), recursive=True),
+        )
+        if _path_key(nsp_file) not in referenced_keys
+    ]
+    total_files = len(nsp_files)
+    for index, nsp_file in enumerate(nsp_files):
+        _progress_bar(index + 1, total_files, suffix=f"\nProcessing {nsp_file}")
+
+        args = [
+            hactoolnet_path,
+            "-k",
+            title_keys_path,
+            "-t",
+            "pfs0",
+            nsp_file,
+            "--listtitles",
+        ]
+        try:
+            output = subprocess.check_output(args).decode("utf-8")
+        except CalledProcessError:
+            print(f"Error when process {nsp_file}")
+            continue
+
+        if "Application" in output:
+            continue
+
+        title_id_match = re.search("0100[a-zA-Z0-9]{12} v", output)
+        if title_id_match is None:
+            print(f"No title id is found for {nsp_file}")
+            continue
+        title_id = output[title_id_match.start() : title_id_match.end()]
+        title_id = title_id.lower().replace(" v", "")
+
+        nca_id = None
+
+        # updates.json is keyed by application id, dlc.json entries by dlc title id
+        if "Patch" in output:
+            title_id = title_id[:13] + "0" + title_id[14:]
+
+        if "AddOnContent" in output:
+            nca_id_match = re.search(r"pfs0:/[a-z0-9]{32}.nca", output)
+            if nca_id_match is None:
+                print(f"No nca id is found for {nsp_file}")
+                continue
+            nca_id = output[nca_id_match.start() : nca_id_match.end()][6:38]
+
+        moved_nsp_map.setdefault(title_id, []).append(
+            {"path": nsp_file, "nca_id": nca_id}
+        )
+
+    return moved_nsp_map
+
+
+def _find_moved_nsp_file(path, candidates, referenced_keys):
+    candidates = [c for c in candidates if _path_key(c["path"]) not in referenced_keys]
+    filename = os.path.normcase(os.path.basename(path))
+    new_nsp = next(
+        (
+            c
+            for c in candidates
+            if os.path.normcase(os.path.basename(c["path"])) == filename
+        ),
+        candidates[0] if len(candidates) == 1 else None,
+    )
+    if new_nsp is not None:
+        referenced_keys.add(_path_key(new_nsp["path"]))
+    return new_nsp
+
+
+def _plan_operation(operation_type, **kwargs):
+    planned_operations.append({"op": operation_type, "done": False, **kwargs})
+
+
+def _save_plan(path, operations):
+    # Write to a temp file first so a crash never leaves a corrupted plan
+    tmp_path = path + ".tmp"
+    with io.open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"version": VERSION, "operations": operations}, indent=2))
+    os.replace(tmp_path, path)
+
+
+def _write_json(path, content):
+    if plan_path is not None:
+        _plan_operation(
+            WRITE_JSON_OPERATION, path=os.path.abspath(path), content=content
+        )
+        return
+
+    output_dir = os.path.dirname(path)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    with io.open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(content, indent=2))
+
+
+def _get_titledb_file(path, local_path):
+    if path is not None:
+        return path
+    if os.path.isfile(local_path):
+        return local_path
+
+    filename = os.path.basename(local_path)
+    print(f"Downloading {filename}")
+    result = urllib.request.urlretrieve(f"{TITLEDB_URL}/{filename}", local_path)
+    print(f"Downloaded to {result[0]}")
+    return result[0]
+
+
+def _format_release_date(release_date):
+    # titledb stores release dates as yyyymmdd integers
+    if release_date is None:
+        return None
+    release_date = str(release_date)
+    if len(release_date) != 8:
+        return release_date
+    return f"{release_date[:4]}-{release_date[4:6]}-{release_date[6:]}"
+
+
+def _open_catalog():
+    if os.path.isfile(catalog_path) is False:
+        return None
+    conn = sqlite3.connect(catalog_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _get_catalog_title(catalog, title_id):
+    return catalog.execute(
+        "SELECT name, publisher, release_date FROM titles WHERE id = ?",
+        (title_id.lower(),),
+    ).fetchone()
+
+
+def _get_catalog_latest_version(catalog, application_id):
+    row = catalog.execute(
+        "SELECT version, release_date FROM versions WHERE id = ? ORDER BY version DESC LIMIT 1",
+        (application_id.lower(),),
+    ).fetchone()
+    if row is None:
+        raise KeyError(application_id)
+    return str(row["version"]), row["release_date"]
+
+
+def _get_title_name(catalog, title_id):
+    if catalog is not None:
+        title = _get_catalog_title(catalog, title_id)
+        if title is not None and title["name"] is not None:
+            return title["name"]
+    if nsp_dir is None:
+        return None
+    return next(
+        (t for t in os.listdir(nsp_dir) if title_id.lower() in t.lower()), None
+    )
+
+
+def _sync_dir(_yuzu_dir, _ryujinx_dir, title_id, catalog=None):
+    log_suffix = "-"
+    if plan_path is not None:
+        log_suffix = "- [Plan]"
+    elif should_simulate_sync:
+        log_suffix = "- [Simulate]"
     reason = "Unknown error."
     src = None
     dst = None
-    title = next(
-        (t for t in os.listdir(nsp_dir) if title_id.lower() in t.lower()), None
-    )
+    title = _get_title_name(catalog, title_id)
     if YUZU_PRIORIY in sync_priority:
         src = _yuzu_dir
         dst = _ryujinx_dir
@@ -572,11 +1101,17 @@ def _sync_dir(_yuzu_dir, _ryujinx_dir, title_id):
             reason = "yuzu & Ryujinx saves are synced."
 
     if src is not None and dst is not None:
-        if should_simulate_sync is False:
-            if os.path.isdir(dst) is False:
-                os.makedirs(dst)
-            _back_up_save(dst)
-            shutil.copytree(src, dst, dirs_exist_ok=True)
+        if plan_path is not None:
+            _plan_operation(
+                COPY_SAVE_OPERATION,
+                title_id=title_id,
+                direction=YUZU_TO_RYUJINX if src == _yuzu_dir else RYUJINX_TO_YUZU,
+                reason=reason,
+                yuzu_dir=os.path.abspath(_yuzu_dir),
+                ryujinx_dir=os.path.abspath(ryujinx_dir),
+            )
+        elif should_simulate_sync is False:
+            _copy_save(src, dst)
         print(
             log_suffix,
             title if title is not None else title_id,
@@ -587,6 +1122,13 @@ def _sync_dir(_yuzu_dir, _ryujinx_dir, title_id):
         print(log_suffix, title if title is not None else title_id, reason)
 
 
+def _copy_save(src, dst):
+    if os.path.isdir(dst) is False:
+        os.makedirs(dst)
+    _back_up_save(dst)
+    shutil.copytree(src, dst, dirs_exist_ok=True)
+
+
 def _back_up_save(save_dir):
     src = save_dir
     is_ryujinx = False
@@ -637,14 +1179,16 @@ def _validate_args():
     ):
         raise TypeError("At least one argument in actions group is required")
 
-    if os.path.isfile(hactoolnet_path) is False:
-        raise ArgumentError(
-            hactoolnet_arg,
-            f"{'hactoolnet.exe' if os.name == 'nt' else 'hactoolnet'} not found",
-        )
+    # Only actions scanning NSP files need hactoolnet
+    if should_auto_add or should_export_csv or (should_reconcile and nsp_dir):
+        if os.path.isfile(hactoolnet_path) is False:
+            raise ArgumentError(
+                hactoolnet_arg,
+                f"{'hactoolnet.exe' if os.name == 'nt' else 'hactoolnet'} not found",
+            )
 
-    if os.path.isfile(title_keys_path) is False:
-        raise ArgumentError(titlekeys_arg, "file not found")
+        if os.path.isfile(title_keys_path) is False:
+            raise ArgumentError(titlekeys_arg, "file not found")
 
     if should_auto_add:
         if ryujinx_dir is None:
@@ -658,6 +1202,30 @@ def _validate_args():
         if os.path.isdir(nsp_dir) is False:
             raise ArgumentError(nspdir_arg, "directory not existed")
 
+    if plan_path is not None:
+        if apply_path is not None:
+            raise ArgumentError(
+                plan_arg, f"not allowed with {_get_action_name(apply_arg)}"
+            )
+        if (
+            should_auto_add is False
+            and should_sync_saves is False
+            and should_reconcile is False
+        ):
+            raise ArgumentError(
+                plan_arg,
+                f"requires {_get_action_name(autoadd_arg)}, {_get_action_name(syncsaves_arg)} or {_get_action_name(reconcile_arg)}",
+            )
+
+    if apply_path is not None and os.path.isfile(apply_path) is False:
+        raise ArgumentError(apply_arg, "file not found")
+
+    if should_build_catalog:
+        if versions_path is not None and os.path.isfile(versions_path) is False:
+            raise ArgumentError(versionspath_arg, "file not found")
+        if titles_path is not None and os.path.isfile(titles_path) is False:
+            raise ArgumentError(titlespath_arg, "file not found")
+
     if should_export_csv:
         if versions_path is not None and os.path.isfile(versions_path) is False:
             raise ArgumentError(versionspath_arg, "file not found")
@@ -669,6 +1237,15 @@ def _validate_args():
         if os.path.isdir(nsp_dir) is False:
             raise ArgumentError(nspdir_arg, "directory not existed")
 
+    if should_reconcile:
+        if ryujinx_dir is None:
+            raise ArgumentError(
+                ryujinxdir_arg,
+                f"required when having {_get_action_name(reconcile_arg)}",
+            )
+        if nsp_dir is not None and os.path.isdir(nsp_dir) is False:
+            raise ArgumentError(nspdir_arg, "directory not existed")
+
     if should_sync_saves:
         if ryujinx_dir is None:
             raise ArgumentError(
@@ -698,11 +1275,24 @@ def _progress_bar(current, total, bar_length=20, suffix=""):
 
 _validate_args()
 
+if should_build_catalog:
+    build_catalog()
+
 if should_auto_add:
     generate_ryujinx_json()
 
+if should_reconcile:
+    reconcile_ryujinx_json()
+
 if should_export_csv:
     export_updates_csv()
 
 if should_sync_saves:
     sync_saves()
+
+if plan_path is not None:
+    _save_plan(plan_path, planned_operations)
+    print(f"Planned {len(planned_operations)} operations to {plan_path}")
+
+if apply_path is not None:
+    apply_plan()